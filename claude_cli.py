@@ -14,6 +14,13 @@ from dotenv import load_dotenv
 from claude_conversation_manager import ConversationManager, ClaudeInstance
 import threading
 
+# Use uvloop for the event loop when it's available
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
+
 # Load environment variables
 load_dotenv()
 
@@ -100,7 +107,7 @@ class ConversationCLI:
         elif cmd == "status":
             status = "paused" if self.manager.is_paused else "running"
             console.print(f"Conversation status: [{status}]{status}[/{status}]")
-            console.print(f"Messages exchanged: {len(self.manager.conversation_history)}")
+            console.print(f"Messages exchanged: {self.manager.message_count}")
         
         elif cmd == "help":
             self.show_commands()
@@ -122,7 +129,9 @@ class ConversationCLI:
 @click.option('--model', default='claude-3-sonnet-20240229', help='Claude model to use')
 @click.option('--api-key', envvar='ANTHROPIC_API_KEY', help='Anthropic API key')
 @click.option('--no-mcp', is_flag=True, help='Disable MCP tools for both Claude instances')
-def main(claude1_name, claude1_prompt, claude2_name, claude2_prompt, model, api_key, no_mcp):
+@click.option('--transcript', default=None, help='Append every message to this JSONL file as it arrives')
+@click.option('--history-window', type=int, default=None, help='Keep only this many recent messages in memory and context')
+def main(claude1_name, claude1_prompt, claude2_name, claude2_prompt, model, api_key, no_mcp, transcript, history_window):
     """Claude-to-Claude Conversation CLI"""
     
     console.print("[bold blue]Claude-to-Claude Conversation System[/bold blue]")
@@ -152,7 +161,8 @@ def main(claude1_name, claude1_prompt, claude2_name, claude2_prompt, model, api_
         claude1, claude2 = cli.setup_claude_instances(config)
         
         # Create conversation manager
-        cli.manager = ConversationManager(claude1, claude2)
+        cli.manager = ConversationManager(claude1, claude2, transcript_path=transcript,
+                                          history_window=history_window)
         
         console.print(f"\n[green]✓ Initialized {claude1_name} and {claude2_name}[/green]")
         console.print(f"[cyan]Model: {model}[/cyan]")
@@ -197,6 +207,9 @@ def main(claude1_name, claude1_prompt, claude2_name, claude2_prompt, model, api_
                 if Confirm.ask("Save conversation before exiting?"):
                     filename = Prompt.ask("Filename", default="conversation.json")
                     cli.manager.save_conversation(filename)
+            
+            if cli.manager:
+                cli.manager.close()
     
     except Exception as e:
         console.print(f"[red]Error: {str(e)}[/red]")
@@ -5,26 +5,27 @@ Manages conversations between two Claude instances with MCP integration
 """
 
 import asyncio
-import json
 import os
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass, field
 from datetime import datetime
 import anthropic
+import httpx
+import orjson
 from anthropic import AsyncAnthropic
 from rich.console import Console
-from rich.panel import Panel
-from rich.text import Text
-from rich.markdown import Markdown
 import logging
 from pathlib import Path
 import subprocess
-import pty
+import threading
 import select
-import termios
-import tty
+import signal
 import time
 import re
+import shlex
+import itertools
 
 # Configure logging
 logging.basicConfig(
@@ -38,13 +39,122 @@ logger = logging.getLogger(__name__)
 
 console = Console()
 
+# Bytes requested per read from the shell's output pipe
+READ_BUF_SIZE = 65_536
+# Heredoc operators and their delimiters:
+# - <<EOF, << EOF (with/without spaces)
+# - <<'EOF', <<"EOF" (quoted delimiters)
+# - <<-EOF (ignore leading tabs)
+# - Support alphanumeric delimiters and underscores
+HEREDOC_RE = re.compile(r'<<-?\s*[\'"]?([A-Za-z_][A-Za-z0-9_]*)[\'"]?')
+# Messages larger than this are shown as plain text instead of Markdown
+MAX_MD = 32_768
+# Upper bound on tool calls running at once within a single turn
+MAX_CONCURRENT_TOOLS = 8
+# Upper bound on in-flight Anthropic API requests per manager
+MAX_CONCURRENT_REQUESTS = 16
+# Tools that only read, so consecutive calls of them within a reply may overlap
+READ_ONLY_TOOLS = frozenset({"read_file", "list_directory"})
+# Read-only tools whose results are briefly reused for identical calls
+CACHEABLE_TOOLS = READ_ONLY_TOOLS
+TOOL_CACHE_TTL = 5.0  # seconds
+TOOL_CACHE_SIZE = 256
+# Approximate number of history tokens sent with each request
+CONTEXT_TOKEN_BUDGET = 80_000
+
+# Tool definitions offered to Claude. Shared by every manager and never
+# mutated, so each request sends the same (prompt-cacheable) tool prefix
+MCP_TOOLS = (
+    {
+        "name": "run_command",
+        "description": "Execute any shell command and return the complete output. This tool can be used for all operations including git, file manipulation, directory navigation, etc. For commands with large outputs, consider using options to limit output (e.g., head, tail, --oneline for git) or increase the timeout parameter.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "command": {
+                    "type": "string",
+                    "description": "The shell command to execute. Can be any valid shell command including pipes, redirections, etc. For large file operations, prefer using head/tail over cat."
+                },
+                "timeout": {
+                    "type": "integer",
+                    "description": "Command timeout in seconds (default: 60, max: 300). Increase for operations that may take longer or produce large outputs."
+                }
+            },
+            "required": ["command"]
+        }
+    },
+    {
+        "name": "change_directory",
+        "description": "Change the shell's current working directory. Relative paths are resolved against the current directory.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "The directory path to change to"
+                }
+            },
+            "required": ["path"]
+        }
+    },
+    {
+        "name": "read_file",
+        "description": "Read the contents of a text file. Relative paths are resolved against the shell's current directory.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "Path to the file to read"
+                }
+            },
+            "required": ["path"]
+        }
+    },
+    {
+        "name": "write_file",
+        "description": "Write content to a file exactly as given, without any shell quoting or escaping. Prefer this over echo for creating or editing files. Missing parent directories are created. Relative paths are resolved against the shell's current directory.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "Path to the file to write"
+                },
+                "content": {
+                    "type": "string",
+                    "description": "Content to write to the file"
+                },
+                "append": {
+                    "type": "boolean",
+                    "description": "Whether to append to the file (default: false)"
+                }
+            },
+            "required": ["path", "content"]
+        }
+    },
+    {
+        "name": "list_directory",
+        "description": "List the contents of a directory with file sizes. Relative paths are resolved against the shell's current directory.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "Directory path to list (default: current directory)"
+                }
+            },
+            "required": []
+        },
+        # Last tool closes the cacheable tools prefix for prompt caching
+        "cache_control": {"type": "ephemeral"}
+    }
+)
+
 class PersistentShell:
     """Maintains a persistent shell session"""
     
     def __init__(self, working_dir: str = None):
-        # Create a pseudo-terminal
-        self.master, slave = pty.openpty()
-        
         # Set up environment - preserve the full environment to keep SSH agent access
         env = os.environ.copy()
         
@@ -64,82 +174,124 @@ class PersistentShell:
         if 'HOME' in os.environ:
             env['HOME'] = os.environ['HOME']
             
-        # Set minimal prompt to avoid issues
-        env['PS1'] = '$ '  # Simple prompt without backslash escaping
-        env['PS2'] = '> '
         env['TERM'] = 'dumb'  # Avoid terminal control sequences
+        self._env = env
         
-        # Start bash with the user's profile to ensure proper initialization
-        # Use --login to source profile files and get the full user environment
+        # Completion markers: a fixed per-process prefix plus a counter
+        self._marker_prefix = f"__MARK_{os.getpid()}_".encode()
+        self._marker_seq = 0
+        # Matches any of our markers, including stale ones from timed-out
+        # commands. Each carries its sequence number, the exit status and
+        # the shell's working directory, and ends at the line break
+        self._marker_re = re.compile(re.escape(self._marker_prefix) + rb"(\d+)_(\d+)__([^\n]*)\n")
+        # Exit status of the last command read up to its marker (None on timeout)
+        self.last_exit_code: Optional[int] = None
+        # Set by close(), after which the shell is never restarted
+        self.closed = False
+        
+        self._spawn(working_dir)
+        
+        # Log SSH agent status for debugging
+        logger.info(f"SSH_AUTH_SOCK: {env.get('SSH_AUTH_SOCK', 'Not set')}")
+        logger.info(f"HOME: {env.get('HOME', 'Not set')}")
+    
+    def _spawn(self, working_dir: Optional[str]):
+        """Start bash in the given directory and wait until it is ready"""
+        # Plain pipes rather than a pty: bash runs non-interactively, so there
+        # are no prompts, no echo and no line discipline to strip or work
+        # around. It inherits this process's environment instead of sourcing
+        # rc files
         self.shell = subprocess.Popen(
-            ['/bin/bash'],  # Use login shell to get full environment
-            stdin=slave,
-            stdout=slave,
-            stderr=slave,
+            ['/bin/bash'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             cwd=working_dir,
-            env=env,
-            universal_newlines=False,
+            env=self._env,
+            bufsize=0,
             preexec_fn=os.setsid
         )
-        os.close(slave)
+        self._stdin = self.shell.stdin.fileno()
+        self._stdout = self.shell.stdout.fileno()
+        # Readiness is always checked before reading or after a short write,
+        # so both pipes stay non-blocking for the life of the session
+        os.set_blocking(self._stdin, False)
+        os.set_blocking(self._stdout, False)
         self.current_dir = working_dir or os.getcwd()
         
-        # Set up the prompt explicitly
-        self._setup_shell()
+        # Readiness is polled on the output pipe, registered once for the session
+        self._poller = select.poll()
+        self._poller.register(self._stdout, select.POLLIN)
+        # Set when a read hits EOF because bash has exited
+        self._shell_exited = False
         
-        # Log SSH agent status for debugging
-        logger.info(f"SSH_AUTH_SOCK: {env.get('SSH_AUTH_SOCK', 'Not set')}")
-        logger.info(f"HOME: {env.get('HOME', 'Not set')}")
+        self._setup_shell()
+    
+    def _restart(self):
+        """Replace an exited or killed shell with a fresh one in the last known directory"""
+        logger.warning(f"Restarting shell in {self.current_dir}")
+        self._close_pipes()
+        if self.shell.poll() is None:
+            self.shell.kill()
+        self.shell.wait()
+        self._spawn(self.current_dir if os.path.isdir(self.current_dir) else None)
+    
+    def _send(self, command_bytes: bytes) -> bytes:
+        """Write a command and its completion marker, restarting the shell first if it has exited"""
+        if self.closed:
+            raise RuntimeError("Shell session is closed")
+        if self.shell.poll() is not None:
+            self._restart()
+        try:
+            self._write(command_bytes)
+        except BrokenPipeError:
+            # Exited since the check above, before reading any of the command
+            self._restart()
+            self._write(command_bytes)
+        try:
+            return self._write_marker()
+        except BrokenPipeError:
+            # The command ended the shell; its output is still read up to EOF
+            return str(self._marker_seq).encode()
+    
+    def _read_result(self, seq: bytes, timeout: float, command: str) -> str:
+        """Read a command's output, restarting the shell if the command made it exit"""
+        raw_output = self._read_until_marker(seq, timeout, command)
+        if self.closed:
+            # Shut down while the command ran; don't bring the shell back
+            return f"{raw_output.rstrip()}\n[shell closed]"
+        if self._shell_exited:
+            exit_code = self.shell.wait()
+            self._restart()
+            raw_output = f"{raw_output.rstrip()}\n[shell exited with code {exit_code}; restarted in {self.current_dir}]"
+        elif self.last_exit_code is None:
+            # Timed out. The command would keep the shell busy and make every
+            # later one wait out its own timeout, so kill it along with the shell
+            try:
+                os.killpg(self.shell.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            self._restart()
+            raw_output = f"{raw_output.rstrip()}\n[command timed out after {timeout}s; shell restarted in {self.current_dir}]"
+        return raw_output
         
     def _setup_shell(self):
-        """Setup the shell with proper prompt"""
+        """Setup the shell and wait until it is ready"""
         # Send commands to set up the shell
         setup_commands = [
-            "PS1='$ '",  # Set simple prompt
-            "PS2='> '",
-            "set +o history",  # Disable history expansion
-            "stty -echo",  # Disable echo to avoid seeing commands twice
             # Test SSH agent connection
             "ssh-add -l > /dev/null 2>&1 && echo 'SSH agent available' || echo 'SSH agent not available'"
         ]
         
-        for cmd in setup_commands:
-            os.write(self.master, (cmd + '\n').encode())
-            time.sleep(0.1)
-        
-        # Clear any output from setup
-        self._clear_output(timeout=0.5)
-        
-    def _clear_output(self, timeout=0.5):
-        """Clear any pending output from the shell"""
-        import fcntl
-        
-        # Set non-blocking mode
-        flags = fcntl.fcntl(self.master, fcntl.F_GETFL)
-        fcntl.fcntl(self.master, fcntl.F_SETFL, flags | os.O_NONBLOCK)
-        
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            try:
-                ready, _, _ = select.select([self.master], [], [], 0.1)
-                if ready:
-                    os.read(self.master, 4096)
-                else:
-                    break
-            except OSError:
-                break
-                
-        # Restore blocking mode
-        fcntl.fcntl(self.master, fcntl.F_SETFL, flags)
+        # Send the whole setup in one write and wait for it to run through
+        self._write(('\n'.join(setup_commands) + '\n').encode())
+        seq = self._write_marker()
+        setup_output = self._read_until_marker(seq, 10, 'shell setup')
+        logger.debug(f"Shell setup output: {setup_output.strip()}")
         
     def execute_command(self, command: str, timeout: int = 30) -> str:
         """Execute a command in the shell"""
         try:
-            import fcntl
-            
-            # Clear any pending output first
-            self._clear_output(timeout=0.2)
-            
             # Check if this is a heredoc command
             is_heredoc = self._is_heredoc_command(command)
             
@@ -156,23 +308,12 @@ class PersistentShell:
     def _is_heredoc_command(self, command: str) -> bool:
         """Check if command contains heredoc syntax"""
         # Look for heredoc patterns like << EOF, << 'EOF', << "EOF", <<-EOF, etc.
-        import re
-        # Enhanced pattern to match various heredoc formats:
-        # - <<EOF, << EOF (with/without spaces)
-        # - <<'EOF', <<"EOF" (quoted delimiters)
-        # - <<-EOF (ignore leading tabs)
-        # - Support alphanumeric delimiters and underscores
-        heredoc_pattern = r'<<-?\s*[\'"]?([A-Za-z_][A-Za-z0-9_]*)[\'"]?'
-        return bool(re.search(heredoc_pattern, command))
+        return bool(HEREDOC_RE.search(command))
     
     def _execute_heredoc_command(self, command: str, timeout: int = 30) -> str:
         """Execute a heredoc command with proper multi-line handling"""
-        import fcntl
-        import re
-        
-        # Extract the delimiter from the command with enhanced pattern
-        heredoc_pattern = r'<<-?\s*[\'"]?([A-Za-z_][A-Za-z0-9_]*)[\'"]?'
-        match = re.search(heredoc_pattern, command)
+        # Extract the delimiter from the command
+        match = HEREDOC_RE.search(command)
         if not match:
             return self._execute_simple_command(command, timeout)
         
@@ -181,247 +322,168 @@ class PersistentShell:
         is_dash_heredoc = '<<-' in command
         logger.debug(f"Detected heredoc command with delimiter: {delimiter}, dash_heredoc: {is_dash_heredoc}")
         
-        # Split command into lines
+        # The body goes to bash as part of the command. If it has body lines
+        # but no closing delimiter, add one so bash doesn't warn about a
+        # heredoc delimited by end of input. A single line has no body, and
+        # its "<<word" may just be text inside quotes
         lines = command.strip().split('\n')
+        content_lines = [line.strip() if is_dash_heredoc else line for line in lines[1:]]
+        if content_lines and delimiter not in content_lines:
+            command = command.rstrip('\n') + '\n' + delimiter
         
-        # Send the first line (the command with heredoc operator)
-        first_line = lines[0] + '\n'
-        os.write(self.master, first_line.encode('utf-8'))
-        
-        # Wait a bit for shell to process and show PS2 prompt
-        time.sleep(0.1)
-        
-        # Send the content lines (everything except first line)
-        content_lines = lines[1:]
-        delimiter_found = False
-        
-        for line in content_lines:
-            # Check if this line is the delimiter
-            stripped_line = line.strip() if is_dash_heredoc else line
-            if stripped_line == delimiter:
-                delimiter_found = True
-            
-            os.write(self.master, (line + '\n').encode('utf-8'))
-            time.sleep(0.05)  # Small delay between lines
-        
-        # If no explicit delimiter was found in the content, we need to send one
-        if content_lines and not delimiter_found:
-            os.write(self.master, (delimiter + '\n').encode('utf-8'))
-        
-        # Set non-blocking mode for reading
-        flags = fcntl.fcntl(self.master, fcntl.F_GETFL)
-        fcntl.fcntl(self.master, fcntl.F_SETFL, flags | os.O_NONBLOCK)
-        
-        output_parts = []
-        start_time = time.time()
-        last_output_time = start_time
-        delimiter_sent = False
-        
-        try:
-            while True:
-                current_time = time.time()
-                
-                # Check for overall timeout
-                if current_time - start_time > timeout:
-                    logger.warning(f"Heredoc command timed out after {timeout}s: {command}")
-                    break
-                
-                # Use select to wait for data
-                ready, _, _ = select.select([self.master], [], [], 0.5)
-                
-                if ready:
-                    try:
-                        data = os.read(self.master, 4096)
-                        if data:
-                            decoded_data = data.decode('utf-8', errors='replace')
-                            output_parts.append(decoded_data)
-                            last_output_time = current_time
-                            
-                            # Check if we see the PS2 prompt, indicating shell is waiting for more input
-                            if '> ' in decoded_data and not delimiter_sent and not content_lines:
-                                # If no content was provided, send the delimiter to close the heredoc
-                                os.write(self.master, (delimiter + '\n').encode('utf-8'))
-                                delimiter_sent = True
-                                logger.debug(f"Sent delimiter '{delimiter}' to close empty heredoc")
-                        else:
-                            # EOF - shell might have closed
-                            break
-                    except OSError as e:
-                        if e.errno == 11:  # EAGAIN/EWOULDBLOCK
-                            continue
-                        else:
-                            logger.error(f"Error reading from shell: {e}")
-                            break
-                else:
-                    # No data available - check if we should continue waiting
-                    # For heredoc commands, we need to wait longer as they might take time to process
-                    if current_time - last_output_time > 3.0:
-                        break
-        
-        finally:
-            # Restore blocking mode
-            fcntl.fcntl(self.master, fcntl.F_SETFL, flags)
-        
-        # Process the output
-        raw_output = ''.join(output_parts)
-        return self._clean_command_output(raw_output, command)
+        return self._execute_simple_command(command, timeout)
     
     def _execute_simple_command(self, command: str, timeout: int = 30) -> str:
         """Execute a simple (non-heredoc) command"""
-        import fcntl
-        
-        # Write the command to the shell
-        command_bytes = (command + '\n').encode('utf-8')
-        os.write(self.master, command_bytes)
+        # Write the command to the shell, followed by the completion marker.
+        # eval keeps a syntax error from ending the non-interactive shell, while
+        # still running in it so cd, exports and the like carry over. Its stdin
+        # is /dev/null: the shell's own input carries the marker and later
+        # commands, which a command reading stdin would otherwise consume
+        command_bytes = f"eval {shlex.quote(command)} </dev/null\n".encode('utf-8')
+        seq = self._send(command_bytes)
         
-        # Set non-blocking mode for reading
-        flags = fcntl.fcntl(self.master, fcntl.F_GETFL)
-        fcntl.fcntl(self.master, fcntl.F_SETFL, flags | os.O_NONBLOCK)
-        
-        output_parts = []
+        # Process the output
+        raw_output = self._read_result(seq, timeout, command)
+        return self._clean_command_output(raw_output, command)
+    
+    def _write(self, data: bytes):
+        """Write all of data to the shell, waiting whenever its input queue is full"""
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[os.write(self._stdin, view):]
+            except BlockingIOError:
+                select.select([], [self._stdin], [], 1.0)
+    
+    def _write_marker(self) -> bytes:
+        """Ask the shell to print the next completion marker and return its sequence number"""
+        self._marker_seq += 1
+        seq = str(self._marker_seq).encode()
+        # Let printf assemble the marker so its literal never appears in the
+        # command text itself. $? still holds
+        # the status of the command that ran before it
+        self._write(b"printf '\\n" + self._marker_prefix + b"%s_%s__%s\\n' " + seq + b' $? "$PWD"\n')
+        return seq
+    
+    def _read_until_marker(self, seq: bytes, timeout: float, command: str) -> str:
+        """Read shell output until the marker with the given sequence number appears or the timeout expires"""
+        buf = bytearray()
         start_time = time.time()
-        last_output_time = start_time
+        self.last_exit_code = None
         
-        try:
-            while True:
-                current_time = time.time()
-                
-                # Check for overall timeout
-                if current_time - start_time > timeout:
-                    logger.warning(f"Command timed out after {timeout}s: {command}")
+        while True:
+            remaining = timeout - (time.time() - start_time)
+            
+            # Check for overall timeout
+            if remaining <= 0:
+                logger.warning(f"Command timed out after {timeout}s: {command}")
+                break
+            
+            # poll returns as soon as data is ready, so wait out the deadline
+            if self._poller.poll(remaining * 1000):
+                try:
+                    data = os.read(self._stdout, READ_BUF_SIZE)
+                except BlockingIOError:
+                    continue
+                except OSError as e:
+                    # close() from another thread shuts the pipe under us
+                    if not self.closed:
+                        logger.error(f"Error reading from shell: {e}")
+                    break
+                if not data:
+                    # EOF - the shell has exited
+                    self._shell_exited = True
                     break
+                # Only the new bytes, plus a tail a split marker may
+                # have started in (room for the prefix and a PATH_MAX
+                # directory), need scanning
+                scan_from = max(0, len(buf) - 4160)
+                buf.extend(data)
                 
-                # Use select to wait for data with a short timeout
-                ready, _, _ = select.select([self.master], [], [], 0.5)
+                match = self._marker_re.search(buf, scan_from)
+                while match and match.group(1) != seq:
+                    # Marker of an earlier command that timed out - what
+                    # precedes it is that command's late output
+                    del buf[:match.end()]
+                    match = self._marker_re.search(buf)
                 
-                if ready:
-                    try:
-                        data = os.read(self.master, 4096)
-                        if data:
-                            output_parts.append(data.decode('utf-8', errors='replace'))
-                            last_output_time = current_time
-                        else:
-                            # EOF - shell might have closed
-                            break
-                    except OSError as e:
-                        if e.errno == 11:  # EAGAIN/EWOULDBLOCK
-                            continue
-                        else:
-                            logger.error(f"Error reading from shell: {e}")
-                            break
-                else:
-                    # No data available - check if we should continue waiting
-                    # If no output for 2 seconds after command start, assume it's done
-                    if current_time - last_output_time > 2.0:
-                        break
-        
-        finally:
-            # Restore blocking mode
-            fcntl.fcntl(self.master, fcntl.F_SETFL, flags)
+                # The command is done once its marker shows up
+                if match:
+                    self.last_exit_code = int(match.group(2))
+                    # Tracks cd, pushd and the like wherever they appear
+                    self.current_dir = match.group(3).decode('utf-8', errors='replace')
+                    del buf[match.start():]
+                    break
         
-        # Process the output
-        raw_output = ''.join(output_parts)
-        return self._clean_command_output(raw_output, command)
+        return buf.decode('utf-8', errors='replace')
     
     def _clean_command_output(self, raw_output: str, command: str) -> str:
-        """Clean up command output by removing prompts and echoed commands"""
-        # Clean up the output by removing the echoed command and prompt
-        lines = raw_output.split('\n')
-        cleaned_lines = []
-        
-        # Skip lines that look like prompts or the echoed command
-        for line in lines:
-            stripped = line.strip()
-            # Skip empty lines, prompts, or the command itself
-            if (stripped and 
-                not stripped.startswith('$ ') and 
-                not stripped.startswith('> ') and
-                stripped != command.strip()):
-                cleaned_lines.append(line.rstrip())
-        
-        # Join the cleaned lines
-        result = '\n'.join(cleaned_lines).strip()
-        
-        # Update current directory if this was a cd command
-        if command.strip().startswith('cd '):
-            try:
-                # Get current directory from shell
-                os.write(self.master, b'pwd\n')
-                time.sleep(0.1)
-                pwd_output = self._read_immediate_output()
-                if pwd_output:
-                    new_dir = pwd_output.strip().split('\n')[-1].strip()
-                    if new_dir and new_dir.startswith('/'):
-                        self.current_dir = new_dir
-                        logger.debug(f"Updated current directory to: {self.current_dir}")
-            except Exception as e:
-                logger.debug(f"Could not update current directory: {e}")
-        
-        logger.debug(f"Command '{command}' executed successfully")
-        return result
-    
-    def _read_immediate_output(self, timeout: float = 1.0) -> str:
-        """Read immediate output from shell (helper method)"""
-        import fcntl
+        """Trim command output and report a failing exit status"""
+        exit_code = self.last_exit_code
         
-        # Set non-blocking mode
-        flags = fcntl.fcntl(self.master, fcntl.F_GETFL)
-        fcntl.fcntl(self.master, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        # Nothing to scrub: the shell prints no prompts or echo, only the
+        # newline the marker starts with (and any left over from the last one)
+        result = raw_output.strip()
         
-        output_parts = []
-        start_time = time.time()
-        
-        try:
-            while time.time() - start_time < timeout:
-                ready, _, _ = select.select([self.master], [], [], 0.1)
-                if ready:
-                    try:
-                        data = os.read(self.master, 4096)
-                        if data:
-                            output_parts.append(data.decode('utf-8', errors='replace'))
-                        else:
-                            break
-                    except OSError as e:
-                        if e.errno == 11:  # EAGAIN
-                            continue
-                        break
-                else:
-                    if output_parts:  # If we have some output, we can stop
-                        break
-        finally:
-            # Restore blocking mode
-            fcntl.fcntl(self.master, fcntl.F_SETFL, flags)
+        # Let the caller tell failures from successes with no output
+        if exit_code:
+            result = f"{result}\n[exit code {exit_code}]".lstrip()
         
-        return ''.join(output_parts)
+        logger.debug(f"Command '{command}' finished with exit code {exit_code}")
+        return result
+    
+    def change_directory(self, path: str):
+        """Change to an already validated absolute directory"""
+        seq = self._send(f"cd {shlex.quote(path)}\n".encode('utf-8'))
+        # The marker reports the new directory and whether cd succeeded
+        return self._read_result(seq, 5, 'cd')
     
     def close(self):
         """Close the shell session"""
+        self.closed = True
         if hasattr(self, 'shell') and self.shell.poll() is None:
             try:
-                # Send exit command
-                os.write(self.master, b'exit\n')
-                time.sleep(0.1)
+                # Send exit command and give bash a moment to act on it
+                self._write(b'exit\n')
+                self.shell.wait(timeout=1)
             except:
                 pass
             
-            # Terminate if still running
+            # Terminate if still running, and kill if that doesn't work either
             if self.shell.poll() is None:
                 self.shell.terminate()
-                self.shell.wait()
+                try:
+                    self.shell.wait(timeout=1)
+                except subprocess.TimeoutExpired:
+                    self.shell.kill()
+                    self.shell.wait()
                 
-        if hasattr(self, 'master'):
+        if hasattr(self, 'shell'):
+            self._close_pipes()
+    
+    def _close_pipes(self):
+        """Close our ends of the shell's pipes"""
+        for pipe in (self.shell.stdin, self.shell.stdout):
             try:
-                os.close(self.master)
+                pipe.close()
             except:
                 pass
 
-@dataclass
+@dataclass(slots=True)
 class Message:
     """Represents a message in the conversation"""
     role: str
     content: str
     timestamp: datetime = field(default_factory=datetime.now)
     claude_instance: Optional[str] = None
+    # Richer rendering for the console, when it differs from what Claude sees
+    display_content: Optional[str] = None
+    tokens: int = field(init=False)
+    
+    def __post_init__(self):
+        # Rough token count (~4 characters per token), sized once up front
+        self.tokens = len(self.content) // 4 + 1
 
 @dataclass
 class ClaudeInstance:
@@ -433,71 +495,136 @@ class ClaudeInstance:
     mcp_tools_enabled: bool = True
     
     def __post_init__(self):
-        self.client = AsyncAnthropic(api_key=self.api_key)
+        # Keep a larger pool of keep-alive connections than httpx's default
+        self.client = AsyncAnthropic(
+            api_key=self.api_key,
+            http_client=anthropic.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=30)
+            )
+        )
 
 class ConversationManager:
     """Manages the conversation between two Claude instances"""
     
-    def __init__(self, claude1: ClaudeInstance, claude2: ClaudeInstance):
+    def __init__(self, claude1: ClaudeInstance, claude2: ClaudeInstance, display_pace: Optional[float] = None,
+                 transcript_path: Optional[str] = None, history_window: Optional[int] = None,
+                 context_budget: int = CONTEXT_TOKEN_BUDGET, display: bool = True):
         self.claude1 = claude1
         self.claude2 = claude2
-        self.conversation_history: List[Message] = []
+        # With a history_window only the most recent messages are kept in
+        # memory (and sent to the API); older ones live on in the transcript
+        self.conversation_history: deque = deque(maxlen=history_window)
+        self.message_count = 0
+        # Only the newest messages fitting this many tokens are sent to the API
+        self.context_budget = context_budget
+        if history_window and not transcript_path:
+            transcript_path = "conversation.jsonl"
+        # Optional JSONL log that each message is appended to as it arrives.
+        # Messages come from both the conversation loop and the CLI thread
+        self.transcript_path = transcript_path
+        self._transcript_lock = threading.Lock()
+        # Kept open for the whole session rather than reopened per message
+        self._transcript = open(transcript_path, 'ab', buffering=1 << 16) if transcript_path else None
+        # Where this session's messages start, if the file already had some
+        self._transcript_start = self._transcript.tell() if self._transcript else 0
+        # Each Claude's API-ready view of the history, appended to as
+        # messages arrive instead of being rebuilt on every turn
+        self._formatted: Dict[str, deque] = {
+            claude1.name: deque(maxlen=history_window),
+            claude2.name: deque(maxlen=history_window)
+        }
+        # Messages are rendered by a separate worker so pacing the display
+        # (display_pace seconds apart) never holds up the next API call.
+        # Pacing is only for a reader watching a terminal. With display off
+        # (e.g. when driven as a library) messages are never rendered
+        self.display = display
+        if display_pace is None:
+            display_pace = 2.0 if console.is_terminal else 0.0
+        self.display_pace = display_pace
+        self._display_queue: asyncio.Queue = asyncio.Queue()  # Unbounded, never blocks producers
+        self._display_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # The reply currently being generated, cancelled when pausing
+        self._current_task: Optional[asyncio.Task] = None
+        # Whether the reply in progress has started any tool calls
+        self._reply_tools_started = False
         self.is_paused = False
         self.pause_event = asyncio.Event()
         self.pause_event.set()  # Start unpaused
-        self.mcp_tools = self._get_mcp_tools()
+        self.mcp_tools = MCP_TOOLS
         
         # Initialize persistent shell
         project_dir = Path(__file__).parent.absolute()
         self.shell = PersistentShell(str(project_dir))
+        # One shell can only run one command at a time, so shell work goes
+        # through its own single thread and queues up there in order
+        self._shell_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shell")
+        self._tool_semaphore = asyncio.Semaphore(MAX_CONCURRENT_TOOLS)
+        self._api_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        # (tool, cwd, arguments) -> (time, result) for CACHEABLE_TOOLS, in LRU order
+        self._tool_cache: OrderedDict = OrderedDict()
         self.current_dir = str(project_dir)
         logger.info(f"Initialized persistent shell in {self.current_dir}")
         
-    def __del__(self):
-        """Cleanup shell on deletion"""
-        if hasattr(self, 'shell'):
-            self.shell.close()
-            logger.info("Closed persistent shell")
-        
-    def _get_mcp_tools(self) -> List[Dict[str, Any]]:
-        """Get MCP tools definition for Claude"""
-        return [
-            {
-                "name": "run_command",
-                "description": "Execute any shell command and return the complete output. This tool can be used for all operations including git, file manipulation, directory navigation, etc. For commands with large outputs, consider using options to limit output (e.g., head, tail, --oneline for git) or increase the timeout parameter.",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "command": {
-                            "type": "string",
-                            "description": "The shell command to execute. Can be any valid shell command including pipes, redirections, etc. For large file operations, prefer using head/tail over cat."
-                        },
-                        "timeout": {
-                            "type": "integer",
-                            "description": "Command timeout in seconds (default: 60, max: 300). Increase for operations that may take longer or produce large outputs."
-                        }
-                    },
-                    "required": ["command"]
-                }
-            }
-        ]
+    def close(self):
+        """Close the transcript and the persistent shell"""
+        if self._transcript:
+            with self._transcript_lock:
+                self._transcript.close()
+                self._transcript = None
+        self._shell_executor.shutdown(wait=False)
+        self.shell.close()
+        logger.info("Closed persistent shell")
     
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        # Shutting the shell down can wait on bash briefly
+        await asyncio.to_thread(self.close)
+        
     async def execute_mcp_tool(self, tool_name: str, arguments: Dict[str, Any]) -> str:
-        """Execute an MCP tool using the persistent shell"""
+        """Execute an MCP tool, reusing recent results of read-only tools"""
+        if tool_name not in CACHEABLE_TOOLS:
+            # Anything else may change files or the current directory
+            self._tool_cache.clear()
+            return await self._run_tool(tool_name, arguments)
+        
+        # Arguments come from JSON and may hold lists or dicts, so key on their
+        # canonical serialization rather than hashing the values themselves
+        try:
+            key = (tool_name, self.shell.current_dir, orjson.dumps(arguments, option=orjson.OPT_SORT_KEYS))
+        except TypeError:
+            return await self._run_tool(tool_name, arguments)
+        cached = self._tool_cache.get(key)
+        if cached and time.monotonic() - cached[0] < TOOL_CACHE_TTL:
+            self._tool_cache.move_to_end(key)
+            return cached[1]
+        
+        result = await self._run_tool(tool_name, arguments)
+        self._tool_cache[key] = (time.monotonic(), result)
+        self._tool_cache.move_to_end(key)
+        if len(self._tool_cache) > TOOL_CACHE_SIZE:
+            self._tool_cache.popitem(last=False)
+        return result
+    
+    async def _run_tool(self, tool_name: str, arguments: Dict[str, Any]) -> str:
+        """Run an MCP tool"""
         
         if tool_name == "run_command":
-            command = arguments["command"]
-            timeout = arguments.get("timeout", 60)  # Increased default timeout
-            
-            # Limit timeout to prevent abuse
-            timeout = min(timeout, 300)
-            
             try:
+                command = arguments["command"]
+                timeout = arguments.get("timeout", 60)  # Increased default timeout
+                
+                # Limit timeout to prevent abuse
+                timeout = min(timeout, 300)
+                
                 # Log the command for debugging
                 logger.info(f"Executing command: {command}")
                 
-                # Execute in persistent shell - this maintains state between commands
-                output = self.shell.execute_command(command, timeout)
+                # Execute in persistent shell - this maintains state between commands.
+                # Reading up to the completion marker blocks, so it runs in a worker thread
+                output = await self._run_in_shell(self.shell.execute_command, command, timeout)
                 
                 # Always return the full output to the bot
                 return output
@@ -507,57 +634,280 @@ class ConversationManager:
                 logger.error(error_msg, exc_info=True)
                 return error_msg
         
+        # File tools go straight to the filesystem (in a worker thread) rather
+        # than through the shell, so they need neither the shell thread nor quoting
+        elif tool_name == "read_file":
+            try:
+                file_path = self._resolve_tool_path(arguments["path"])
+                data = await asyncio.to_thread(file_path.read_bytes)
+                # Don't fail on binary or mis-encoded files
+                return data.decode('utf-8', errors='replace')
+            except Exception as e:
+                return f"Error reading file: {str(e)}"
+        
+        elif tool_name == "write_file":
+            append = arguments.get("append", False)
+            try:
+                file_path = self._resolve_tool_path(arguments["path"])
+                size = await asyncio.to_thread(self._write_file_sync, file_path, arguments["content"], append)
+                action = "Appended to" if append else "Wrote to"
+                return f"{action} file: {file_path} ({size} bytes)"
+            except Exception as e:
+                return f"Error writing file: {str(e)}"
+        
+        elif tool_name == "change_directory":
+            try:
+                target = self._resolve_tool_path(arguments["path"]).resolve()
+                if not target.is_dir():
+                    return f"Path is not a directory: {target}"
+                
+                # Validated here, so the shell only needs a plain cd (no pwd
+                # check). Its status and directory are read on the shell's
+                # thread, before any later command can replace them
+                def change_directory():
+                    output = self.shell.change_directory(str(target))
+                    return output, self.shell.last_exit_code, self.shell.current_dir
+                
+                output, exit_code, current_dir = await self._run_in_shell(change_directory)
+                if exit_code != 0:
+                    status = "timed out" if exit_code is None else f"exit code {exit_code}"
+                    return f"Failed to change directory to {target} ({status}): {output.strip()}\nCurrent directory: {current_dir}"
+                return f"Changed directory to: {current_dir}"
+            except Exception as e:
+                return f"Error changing directory: {str(e)}"
+        
+        elif tool_name == "list_directory":
+            try:
+                dir_path = self._resolve_tool_path(arguments.get("path", "."))
+                return await asyncio.to_thread(self._list_directory_sync, dir_path)
+            except Exception as e:
+                return f"Error listing directory: {str(e)}"
+        
         return f"Unknown tool: {tool_name}"
     
+    async def _run_in_shell(self, func, *args):
+        """Run a blocking shell call on the shell's thread"""
+        return await asyncio.get_running_loop().run_in_executor(self._shell_executor, func, *args)
+    
+    def _resolve_tool_path(self, path: str) -> Path:
+        """Resolve a tool path against the shell's current directory"""
+        return Path(self.shell.current_dir) / Path(path).expanduser()
+    
+    @staticmethod
+    def _write_file_sync(file_path: Path, content: str, append: bool) -> int:
+        """Write a file directly and return its resulting size"""
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        flags = os.O_WRONLY | os.O_CREAT | (os.O_APPEND if append else os.O_TRUNC)
+        fd = os.open(file_path, flags, 0o644)
+        try:
+            # Raw writes of the encoded content, with no file object buffering
+            # it a second time
+            view = memoryview(content.encode('utf-8'))
+            while view:
+                view = view[os.write(fd, view):]
+            # One fstat on the open file stands in for a separate verification step
+            return os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+    
+    @staticmethod
+    def _list_directory_sync(dir_path: Path) -> str:
+        """List a directory using the entry types scandir already has"""
+        items = []
+        with os.scandir(dir_path) as entries:
+            for entry in sorted(entries, key=lambda e: e.name):
+                if entry.is_dir():
+                    items.append(f"[DIR]  {entry.name}")
+                else:
+                    items.append(f"[FILE] {entry.name} ({entry.stat().st_size} bytes)")
+        return f"Contents of {dir_path}:\n" + "\n".join(items)
+    
+    async def _execute_tool_after(self, previous: Tuple[asyncio.Task, ...], tool_name: str,
+                                  arguments: Dict[str, Any]) -> str:
+        """Execute an MCP tool once the tool calls it depends on have finished"""
+        if previous:
+            await asyncio.wait(previous)
+        return await self._execute_tool_bounded(tool_name, arguments)
+    
+    async def _execute_tool_bounded(self, tool_name: str, arguments: Dict[str, Any]) -> str:
+        """Execute an MCP tool, capping how many run concurrently"""
+        async with self._tool_semaphore:
+            return await self.execute_mcp_tool(tool_name, arguments)
+    
     def pause(self):
         """Pause the conversation"""
         self.is_paused = True
-        self.pause_event.clear()
+        self._call_in_loop(self.pause_event.clear)
+        # Abandon the reply in progress rather than waiting for it to finish,
+        # unless it has already started running tools
+        self._call_in_loop(self._cancel_reply)
         console.print("[yellow]Conversation paused[/yellow]")
     
+    def _cancel_reply(self):
+        """Cancel the reply in progress if none of its tool calls have started"""
+        # A cancelled reply is requested again on resume, so once it has run a
+        # tool it must finish instead, or the retry would repeat the tool's
+        # side effects while its result is dropped from the history
+        if self._current_task and not self._reply_tools_started:
+            self._current_task.cancel()
+    
     def resume(self):
         """Resume the conversation"""
         self.is_paused = False
-        self.pause_event.set()
+        self._call_in_loop(self.pause_event.set)
         console.print("[green]Conversation resumed[/green]")
     
+    def _call_in_loop(self, callback):
+        """Run a callback on the conversation's event loop, which the CLI drives from another thread"""
+        if self._loop and self._loop.is_running():
+            self._loop.call_soon_threadsafe(callback)
+        else:
+            callback()
+    
+    def _result_from_loop(self, func):
+        """Call func on the conversation's event loop and return its result, waiting from another thread if needed"""
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop or not (self._loop and self._loop.is_running()):
+            return func()
+        
+        future = Future()
+        
+        def run():
+            try:
+                future.set_result(func())
+            except BaseException as e:
+                future.set_exception(e)
+        
+        self._loop.call_soon_threadsafe(run)
+        return future.result()
+    
     def add_user_message(self, content: str):
         """Add a user message to the conversation"""
         message = Message(role="user", content=content, claude_instance="Human")
-        self.conversation_history.append(message)
-        self._display_message(message)
+        
+        # Called from the CLI thread while the loop thread may be iterating the
+        # history deques, so the append itself happens on the loop
+        def append():
+            self._append_message(message)
+            self._queue_display(message)
+        
+        self._call_in_loop(append)
+    
+    def _queue_display(self, message: Message):
+        """Hand a message to the display worker, or display it directly if none is running"""
+        if not self.display:
+            return
+        if self._display_task is None or self._display_task.done():
+            self._display_message(message)
+        else:
+            # May be called from the CLI thread, so go through the loop
+            self._loop.call_soon_threadsafe(self._display_queue.put_nowait, message)
     
     def _display_message(self, message: Message):
         """Display a message in the console"""
+        if not console.is_terminal:
+            # Output is redirected - skip the panel and the Markdown parse
+            console.print(f"{message.claude_instance}: {message.content}",
+                          markup=False, highlight=False, soft_wrap=True)
+            return
+        
+        # Only needed for rich rendering, and Markdown pulls in a parser
+        from rich.markdown import Markdown
+        from rich.panel import Panel
+        from rich.text import Text
+        
         color = "blue" if message.claude_instance == self.claude1.name else "green"
         if message.claude_instance == "Human":
             color = "yellow"
         
+        content = message.display_content or message.content
+        if len(content) > MAX_MD:
+            # Too big to be worth parsing - show it in full as plain text
+            body = Text(content)
+        elif self._is_mostly_code(content):
+            # Fenced tool output gains nothing from a Markdown parse
+            body = Text(content)
+        else:
+            body = Markdown(content)
+        
         panel = Panel(
-            Markdown(message.content),
+            body,
             title=f"[{color}]{message.claude_instance}[/{color}]",
             title_align="left",
             border_style=color
         )
         console.print(panel)
     
-    def _format_conversation_for_claude(self, for_claude: ClaudeInstance) -> List[Dict[str, str]]:
-        """Format conversation history for Claude API"""
-        messages = []
-        for msg in self.conversation_history:
-            if msg.role == "user" or msg.claude_instance == "Human":
-                messages.append({"role": "user", "content": msg.content})
-            elif msg.claude_instance != for_claude.name:
-                # Other Claude's messages appear as user messages
-                messages.append({"role": "user", "content": msg.content})
+    @staticmethod
+    def _is_mostly_code(content: str) -> bool:
+        """Check whether nearly all of the content sits inside ``` fences"""
+        if content.count('```') < 2:
+            return False
+        fenced = sum(len(part) for part in content.split('```')[1::2])
+        return fenced >= 0.9 * len(content)
+    
+    def _append_message(self, message: Message):
+        """Add a message to the history and to each Claude's formatted view"""
+        self.conversation_history.append(message)
+        self.message_count += 1
+        self._persist_message(message)
+        for name, formatted in self._formatted.items():
+            if message.role == "user" or message.claude_instance != name:
+                # User messages and the other Claude's messages appear as user messages
+                formatted.append({"role": "user", "content": message.content})
             else:
                 # This Claude's own messages
-                messages.append({"role": "assistant", "content": msg.content})
+                formatted.append({"role": "assistant", "content": message.content})
+    
+    def _persist_message(self, message: Message):
+        """Append a message to the JSONL transcript, if one is configured"""
+        if not self._transcript:
+            return
+        line = orjson.dumps(self._message_to_dict(message)) + b"\n"
+        with self._transcript_lock:
+            if not self._transcript:
+                return  # Closed meanwhile
+            self._transcript.write(line)
+            # Flushed per message so the transcript survives a crash
+            self._transcript.flush()
+    
+    @staticmethod
+    def _message_to_dict(message: Message) -> Dict[str, Any]:
+        """Serializable form of a message, as stored in saved conversations"""
+        return {
+            "role": message.role,
+            "content": message.content,
+            # orjson writes datetimes in the same ISO 8601 form as isoformat()
+            "timestamp": message.timestamp,
+            "claude_instance": message.claude_instance
+        }
+    
+    def _format_conversation_for_claude(self, for_claude: ClaudeInstance) -> List[Dict[str, str]]:
+        """Format conversation history for Claude API"""
+        formatted = self._formatted[for_claude.name]
         
+        # Walk back from the newest message until the token budget is spent
+        # (always keeping at least the latest one)
+        total = 0
+        keep = 0
+        for message in reversed(self.conversation_history):
+            total += message.tokens
+            if total > self.context_budget and keep:
+                break
+            keep += 1
+        messages = list(itertools.islice(formatted, len(formatted) - keep, None))
+        
+        # A trimmed window may start on this Claude's own turn, but the API
+        # expects the conversation to open with a user message
+        if keep < self.message_count and messages and messages[0]["role"] == "assistant":
+            del messages[0]
         return messages
     
-    async def get_claude_response(self, claude: ClaudeInstance, is_first_message: bool = False) -> str:
-        """Get a response from a Claude instance"""
+    async def get_claude_response(self, claude: ClaudeInstance, is_first_message: bool = False) -> Tuple[str, Optional[str]]:
+        """Get a response from a Claude instance, as (content, display_content)"""
         await self.pause_event.wait()  # Wait if paused
         
         if is_first_message:
@@ -567,64 +917,96 @@ class ConversationManager:
         
         try:
             # Call Claude API with tools if enabled
+            request = {
+                "model": claude.model,
+                "messages": messages,
+                "system": claude.system_prompt,
+                "max_tokens": 8192,  # Increased for longer outputs
+            }
             if claude.mcp_tools_enabled:
-                response = await claude.client.messages.create(
-                    model=claude.model,
-                    messages=messages,
-                    system=claude.system_prompt,
-                    max_tokens=8192,  # Increased for longer outputs
-                    tools=self.mcp_tools
-                )
-            else:
-                response = await claude.client.messages.create(
-                    model=claude.model,
-                    messages=messages,
-                    system=claude.system_prompt,
-                    max_tokens=8192  # Increased for longer outputs
-                )
+                request["tools"] = self.mcp_tools
+            
+            # Stream the reply so each tool call starts as soon as its block is
+            # complete, overlapping execution with the rest of the generation.
+            # A call may depend on the ones before it (a command that creates
+            # a file, then a read of it), so each waits for its predecessor;
+            # only a run of consecutive read-only calls goes in parallel
+            tool_tasks = {}
+            after = ()      # Tasks the next read-only call must wait for
+            readers = []    # Read-only calls started since the last other tool
+            async with self._api_semaphore, claude.client.messages.stream(**request) as stream:
+                async for event in stream:
+                    if event.type == "content_block_stop" and event.content_block.type == "tool_use":
+                        block = event.content_block
+                        self._reply_tools_started = True
+                        if block.name in READ_ONLY_TOOLS:
+                            task = asyncio.create_task(self._execute_tool_after(after, block.name, block.input))
+                            readers.append(task)
+                        else:
+                            task = asyncio.create_task(
+                                self._execute_tool_after(tuple(readers) or after, block.name, block.input)
+                            )
+                            after, readers = (task,), []
+                        tool_tasks[event.index] = task
+                response = await stream.get_final_message()
             
             # Log the response structure for debugging
             logger.debug(f"Response type: {type(response)}")
             logger.debug(f"Response attributes: {dir(response)}")
             
-            # Handle tool use - the response structure is a Message object
+            # Handle tool use - the response structure is a Message object.
+            # Tool calls go into the history tersely and only get the Markdown
+            # treatment in the copy shown on the console
             full_response = ""
+            display_response = ""
             
             # Check if response has content attribute
             if hasattr(response, 'content'):
-                for content_block in response.content:
+                # Wait for the tool calls, keyed by their block index. Unlike
+                # gather, wait leaves them running if this reply is cancelled,
+                # so a command already started still runs to completion
+                if tool_tasks:
+                    await asyncio.wait(tool_tasks.values())
+                tool_results = {index: task.result() for index, task in tool_tasks.items()}
+                
+                for index, content_block in enumerate(response.content):
                     if hasattr(content_block, 'type'):
                         if content_block.type == "text":
                             full_response += content_block.text
+                            display_response += content_block.text
                         elif content_block.type == "tool_use":
-                            # Execute the tool
-                            tool_result = await self.execute_mcp_tool(content_block.name, content_block.input)
+                            tool_result = tool_results[index]
                             
                             # Format the tool use and result nicely
-                            command = content_block.input.get('command', 'Unknown command')
-                            full_response += f"\n\n**Executed Command:**\n```bash\n{command}\n```\n\n**Output:**\n```\n{tool_result}\n```\n"
+                            if content_block.name == "run_command":
+                                command = content_block.input.get('command', 'Unknown command')
+                            else:
+                                command = f"{content_block.name} {content_block.input.get('path', '.')}"
+                            full_response += f"\n\n$ {command}\n{tool_result}\n"
+                            display_response += f"\n\n**Executed Command:**\n```bash\n{command}\n```\n\n**Output:**\n```\n{tool_result}\n```\n"
                     else:
                         # Handle cases where content_block might be a string
                         full_response += str(content_block)
+                        display_response += str(content_block)
             else:
                 # Fallback for different response structures
                 logger.warning(f"Unexpected response structure: {response}")
-                full_response = str(response)
+                full_response = display_response = str(response)
             
             # If we got no response, return a default message
             if not full_response:
-                full_response = "I apologize, but I couldn't generate a proper response."
+                full_response = display_response = "I apologize, but I couldn't generate a proper response."
             
-            return full_response
+            return full_response, (display_response if display_response != full_response else None)
             
         except AttributeError as e:
             logger.error(f"AttributeError in get_claude_response: {str(e)}")
             logger.error(f"Response object: {response if 'response' in locals() else 'No response object'}")
-            return f"Error accessing response attributes: {str(e)}"
+            return f"Error accessing response attributes: {str(e)}", None
         except Exception as e:
             logger.error(f"Error getting Claude response: {str(e)}")
             logger.error(f"Error type: {type(e).__name__}")
-            return f"Error: {str(e)}"
+            return f"Error: {str(e)}", None
     
     async def run_conversation(self, num_exchanges: Optional[int] = None):
         """Run the conversation between two Claude instances"""
@@ -632,30 +1014,62 @@ class ConversationManager:
         current_claude = self.claude1
         other_claude = self.claude2
         is_first = True
+        self._loop = asyncio.get_running_loop()
+        self._display_task = asyncio.create_task(self._display_worker())
         
-        while num_exchanges is None or exchange_count < num_exchanges:
-            if self.is_paused:
-                await self.pause_event.wait()
-            
-            # Get response from current Claude
-            response = await self.get_claude_response(current_claude, is_first)
-            is_first = False
-            
-            # Add to conversation history
-            message = Message(
-                role="assistant",
-                content=response,
-                claude_instance=current_claude.name
-            )
-            self.conversation_history.append(message)
-            self._display_message(message)
-            
-            # Switch roles
-            current_claude, other_claude = other_claude, current_claude
-            exchange_count += 1
+        try:
+            while num_exchanges is None or exchange_count < num_exchanges:
+                if self.is_paused:
+                    await self.pause_event.wait()
+                
+                # Get response from current Claude. It runs as its own task so
+                # pausing can cancel it; a cancelled reply is retried on resume
+                self._reply_tools_started = False
+                self._current_task = asyncio.create_task(
+                    self.get_claude_response(current_claude, is_first)
+                )
+                await asyncio.wait({self._current_task})
+                if self._current_task.cancelled():
+                    continue
+                response, display_response = self._current_task.result()
+                is_first = False
+                
+                # Add to conversation history
+                message = Message(
+                    role="assistant",
+                    content=response,
+                    claude_instance=current_claude.name,
+                    display_content=display_response
+                )
+                self._append_message(message)
+                if self.display:
+                    self._display_queue.put_nowait(message)
+                
+                # Switch roles
+                current_claude, other_claude = other_claude, current_claude
+                exchange_count += 1
             
-            # Small delay to make conversation readable
-            await asyncio.sleep(2)
+            # Let the display catch up before returning
+            await self._display_queue.join()
+        finally:
+            if self._current_task:
+                self._current_task.cancel()
+                self._current_task = None
+            self._display_task.cancel()
+            self._display_task = None
+    
+    async def _display_worker(self):
+        """Render queued messages, paced to keep the conversation readable"""
+        while True:
+            message = await self._display_queue.get()
+            try:
+                # Markdown parsing and rendering happen off the event loop so
+                # they never stall an in-flight stream or tool call
+                await asyncio.to_thread(self._display_message, message)
+            finally:
+                self._display_queue.task_done()
+            if self.display_pace:
+                await asyncio.sleep(self.display_pace)
     
     def save_conversation(self, filename: str):
         """Save the conversation to a file"""
@@ -668,18 +1082,27 @@ class ConversationManager:
                 "name": self.claude2.name,
                 "system_prompt": self.claude2.system_prompt
             },
-            "messages": [
-                {
-                    "role": msg.role,
-                    "content": msg.content,
-                    "timestamp": msg.timestamp.isoformat(),
-                    "claude_instance": msg.claude_instance
-                }
-                for msg in self.conversation_history
-            ]
+            "messages": self._saved_messages()
         }
         
-        with open(filename, 'w') as f:
-            json.dump(conversation_data, f, indent=2)
+        with open(filename, 'wb') as f:
+            f.write(orjson.dumps(conversation_data, option=orjson.OPT_INDENT_2))
         
-        console.print(f"[green]Conversation saved to {filename}[/green]") 
\ No newline at end of file
+        console.print(f"[green]Conversation saved to {filename}[/green]")
+    
+    def _saved_messages(self) -> List[Dict[str, Any]]:
+        """Every message of this session, in saved form"""
+        # The loop thread appends to the history deque, so copy it there
+        # rather than iterate it from the CLI thread
+        message_count, history = self._result_from_loop(
+            lambda: (self.message_count, list(self.conversation_history))
+        )
+        if self._transcript and message_count > len(history):
+            # Messages that fell out of the history window only survive in the
+            # transcript, which already holds each one as a serialized line
+            with self._transcript_lock:
+                self._transcript.flush()
+            with open(self.transcript_path, 'rb') as f:
+                f.seek(self._transcript_start)
+                return [orjson.loads(line) for line in f]
+        return [self._message_to_dict(msg) for msg in history] 
\ No newline at end of file
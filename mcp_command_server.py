@@ -7,7 +7,14 @@ Provides tools for executing shell commands and managing the command line enviro
 import os
 import subprocess
 import asyncio
-from typing import Dict, Any, Optional
+import functools
+import itertools
+import secrets
+import shlex
+import signal
+import stat
+import time
+from typing import Dict, Any, Optional, Tuple
 from pathlib import Path
 from mcp.server import Server
 from mcp.server.models import InitializationOptions
@@ -15,6 +22,13 @@ from mcp.types import Tool, TextContent
 import mcp.server.stdio
 import logging
 
+# Use uvloop for the event loop when it's available
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -25,6 +39,184 @@ server = Server("command-line-server")
 # Store the current working directory
 current_dir = os.getcwd()
 
+READ_BUF_SIZE = 65_536
+# Seconds a cached path resolution is trusted before it is redone
+RESOLVE_TTL = 5.0
+
+class ShellStartError(Exception):
+    """Raised when the persistent shell cannot be started"""
+
+class ShellBusyError(Exception):
+    """Raised when the persistent shell is already running a command"""
+
+class ShellSession:
+    """A long-lived bash process that runs each command in its own subshell"""
+    
+    def __init__(self):
+        self.process = None
+        self.token = secrets.token_hex(8)
+        self.seq = 0
+        self.lock = asyncio.Lock()
+    
+    async def start(self):
+        """Start the bash process"""
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                '/bin/bash', '--noprofile', '--norc',
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True
+            )
+        except OSError as e:
+            raise ShellStartError(str(e)) from e
+    
+    async def run(self, command: str, working_dir: str, timeout: Optional[float]) -> Tuple[int, bytes, bytes]:
+        """Run a command and return its exit code, stdout and stderr, or raise ShellBusyError rather than wait"""
+        # Checking and taking the lock happen with no suspension in between,
+        # so two calls can never both find the session free
+        if self.lock.locked():
+            raise ShellBusyError()
+        await self.lock.acquire()
+        try:
+            # Only pay for a timeout wrapper when there is a timeout
+            if timeout:
+                return await asyncio.wait_for(self._run(command, working_dir), timeout=timeout)
+            return await self._run(command, working_dir)
+        finally:
+            self.lock.release()
+    
+    async def _run(self, command: str, working_dir: str) -> Tuple[int, bytes, bytes]:
+        """Run a command with no time limit, with the session lock already held"""
+        if self.process is None or self.process.returncode is not None:
+            await self.start()
+        
+        self.seq += 1
+        marker = f"\n__END_{self.token}_{self.seq}__".encode()
+        
+        # The subshell keeps cd, exit and variables from leaking into later commands
+        script = (
+            f"( cd -- {shlex.quote(os.path.abspath(working_dir))} && eval {shlex.quote(command)} ) </dev/null\n"
+            f"__rc=$?; printf '\\n__END_{self.token}_{self.seq}__%s\\n' \"$__rc\"; "
+            f"printf '\\n__END_{self.token}_{self.seq}__\\n' >&2\n"
+        )
+        self.process.stdin.write(script.encode())
+        
+        try:
+            await self.process.stdin.drain()
+            (stdout, rc), (stderr, _) = await asyncio.gather(
+                self._read_until(self.process.stdout, marker),
+                self._read_until(self.process.stderr, marker)
+            )
+        except BaseException:
+            # The shell is mid-command; kill it and start a fresh one next time
+            await self.close()
+            raise
+        
+        return int(rc), stdout, stderr
+    
+    async def _read_until(self, stream: asyncio.StreamReader, marker: bytes) -> Tuple[bytes, bytes]:
+        """Read until the marker line, returning the output before it and the rest of its line"""
+        buf = bytearray()
+        scan_from = 0
+        while True:
+            idx = buf.find(marker, scan_from)
+            if idx != -1:
+                end = buf.find(b"\n", idx + len(marker))
+                if end != -1:
+                    return bytes(buf[:idx]), bytes(buf[idx + len(marker):end])
+                scan_from = idx
+            else:
+                scan_from = max(0, len(buf) - len(marker))
+            
+            chunk = await stream.read(READ_BUF_SIZE)
+            if not chunk:
+                raise ConnectionResetError("Shell exited unexpectedly")
+            buf += chunk
+    
+    async def close(self):
+        """Kill the shell and anything it started"""
+        if self.process is None:
+            return
+        if self.process.returncode is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await self.process.wait()
+        self.process = None
+
+shell_session = ShellSession()
+
+def read_lines(path: Path, start_line: int, max_lines: Optional[int]) -> str:
+    """Read a range of lines, decoding only that range and stopping once it is read"""
+    with open(path, 'rb') as f:
+        lines = itertools.islice(f, start_line - 1, None if max_lines is None else start_line - 1 + max_lines)
+        return b''.join(lines).decode('utf-8')
+
+def write_text(path: Path, content: str, append: bool):
+    """Write or append text to a file"""
+    with open(path, 'a' if append else 'w', encoding='utf-8') as f:
+        f.write(content)
+
+async def run_command_once(command: str, working_dir: str, timeout: Optional[float]) -> Tuple[int, bytes, bytes]:
+    """Run a command in a fresh shell process"""
+    # Same shell and stdin as the persistent session; the server's own stdin
+    # is the client's JSON-RPC channel
+    process = await asyncio.create_subprocess_shell(
+        command,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=working_dir,
+        executable='/bin/bash'
+    )
+    
+    try:
+        if timeout:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+        else:
+            stdout, stderr = await process.communicate()
+    except asyncio.TimeoutError:
+        process.terminate()
+        await process.wait()
+        raise
+    
+    return process.returncode, stdout, stderr
+
+def resolve_path_uncached(path: str, cwd: str) -> Path:
+    """Resolve a path against the given working directory, following symlinks as they are now"""
+    return (Path(cwd) / Path(path).expanduser()).resolve()
+
+@functools.lru_cache(maxsize=4096)
+def _resolve_cached(path: str, cwd: str, epoch: int) -> Path:
+    """Resolve a path against the given working directory"""
+    return resolve_path_uncached(path, cwd)
+
+def resolve_path(path: str) -> Path:
+    """Resolve a tool path, reusing earlier resolutions from the same directory"""
+    # The epoch changes every RESOLVE_TTL seconds, so symlinks changed
+    # behind our back are picked up within that time
+    return _resolve_cached(path, current_dir, int(time.monotonic() // RESOLVE_TTL))
+
+def _safe_stat(path: Path) -> Optional[os.stat_result]:
+    """Stat a path once, returning None if it does not exist"""
+    try:
+        return os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+def resolve_and_stat(path: str) -> Tuple[Path, Optional[os.stat_result]]:
+    """Resolve and stat a tool path, re-resolving once if a cached resolution has gone stale"""
+    resolved = resolve_path(path)
+    st = _safe_stat(resolved)
+    if st is None:
+        # Something outside this server may have moved or relinked the path
+        _resolve_cached.cache_clear()
+        resolved = resolve_path(path)
+        st = _safe_stat(resolved)
+    return resolved, st
+
 @server.list_tools()
 async def list_tools() -> list[Tool]:
     """List available command line tools"""
@@ -45,7 +237,7 @@ async def list_tools() -> list[Tool]:
                     },
                     "timeout": {
                         "type": "integer",
-                        "description": "Command timeout in seconds (default: 30)",
+                        "description": "Command timeout in seconds, 0 for none (default: 30)",
                         "default": 30
                     }
                 },
@@ -90,6 +282,15 @@ async def list_tools() -> list[Tool]:
                     "path": {
                         "type": "string",
                         "description": "Path to the file to read"
+                    },
+                    "start_line": {
+                        "type": "integer",
+                        "description": "First line to read, starting at 1 (default: 1)",
+                        "default": 1
+                    },
+                    "max_lines": {
+                        "type": "integer",
+                        "description": "Maximum number of lines to read (default: the whole file)"
                     }
                 },
                 "required": ["path"]
@@ -133,41 +334,42 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> list[TextContent]:
             
             logger.info(f"Executing command: {command} in {working_dir}")
             
-            # Execute the command
-            process = await asyncio.create_subprocess_shell(
-                command,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                cwd=working_dir
-            )
-            
+            # Execute the command in the persistent shell, or a one-off one if
+            # bash is unavailable or the session is busy with another command
             try:
-                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
-                
-                output = f"Command: {command}\n"
-                output += f"Exit code: {process.returncode}\n"
-                if stdout:
-                    output += f"STDOUT:\n{stdout.decode('utf-8')}\n"
-                if stderr:
-                    output += f"STDERR:\n{stderr.decode('utf-8')}\n"
-                
-                return [TextContent(type="text", text=output)]
-                
+                try:
+                    returncode, stdout, stderr = await shell_session.run(command, working_dir, timeout)
+                except ShellBusyError:
+                    # Run alongside the command holding the session rather than queue behind it
+                    returncode, stdout, stderr = await run_command_once(command, working_dir, timeout)
+                except ShellStartError as e:
+                    logger.warning(f"Persistent shell unavailable, running command directly: {e}")
+                    returncode, stdout, stderr = await run_command_once(command, working_dir, timeout)
             except asyncio.TimeoutError:
-                process.terminate()
-                await process.wait()
+                _resolve_cached.cache_clear()
                 return [TextContent(type="text", text=f"Command timed out after {timeout} seconds")]
+            
+            # The command may have moved or relinked anything, so forget cached resolutions
+            _resolve_cached.cache_clear()
+            
+            output = f"Command: {command}\n"
+            output += f"Exit code: {returncode}\n"
+            if stdout:
+                output += f"STDOUT:\n{stdout.decode('utf-8')}\n"
+            if stderr:
+                output += f"STDERR:\n{stderr.decode('utf-8')}\n"
+            
+            return [TextContent(type="text", text=output)]
         
         elif name == "change_directory":
             path = arguments["path"]
             
             # Resolve the path
-            new_path = Path(path).expanduser().resolve()
-            
-            if not new_path.exists():
+            new_path, st = resolve_and_stat(path)
+            if st is None:
                 return [TextContent(type="text", text=f"Directory does not exist: {path}")]
             
-            if not new_path.is_dir():
+            if not stat.S_ISDIR(st.st_mode):
                 return [TextContent(type="text", text=f"Path is not a directory: {path}")]
             
             current_dir = str(new_path)
@@ -178,21 +380,24 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> list[TextContent]:
         elif name == "list_directory":
             path = arguments.get("path", current_dir)
             
-            target_path = Path(path).expanduser().resolve()
-            
-            if not target_path.exists():
+            target_path, st = resolve_and_stat(path)
+            if st is None:
                 return [TextContent(type="text", text=f"Directory does not exist: {path}")]
             
-            if not target_path.is_dir():
+            if not stat.S_ISDIR(st.st_mode):
                 return [TextContent(type="text", text=f"Path is not a directory: {path}")]
             
+            # scandir returns the entry type with each name, so only files need a stat
+            with os.scandir(target_path) as it:
+                entries = sorted(it, key=lambda e: e.name)
+
             items = []
-            for item in sorted(target_path.iterdir()):
-                if item.is_dir():
-                    items.append(f"[DIR]  {item.name}")
+            for entry in entries:
+                if entry.is_dir():
+                    items.append(f"[DIR]  {entry.name}")
                 else:
-                    size = item.stat().st_size
-                    items.append(f"[FILE] {item.name} ({size} bytes)")
+                    size = entry.stat().st_size
+                    items.append(f"[FILE] {entry.name} ({size} bytes)")
             
             output = f"Contents of {target_path}:\n" + "\n".join(items)
             return [TextContent(type="text", text=output)]
@@ -200,17 +405,23 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> list[TextContent]:
         elif name == "read_file":
             path = arguments["path"]
             
-            file_path = Path(path).expanduser().resolve()
-            
-            if not file_path.exists():
+            file_path, st = resolve_and_stat(path)
+            if st is None:
                 return [TextContent(type="text", text=f"File does not exist: {path}")]
             
-            if not file_path.is_file():
+            if not stat.S_ISREG(st.st_mode):
                 return [TextContent(type="text", text=f"Path is not a file: {path}")]
             
+            start_line = max(1, arguments.get("start_line", 1))
+            max_lines = arguments.get("max_lines")
+            
             try:
-                content = file_path.read_text(encoding='utf-8')
-                return [TextContent(type="text", text=f"Contents of {path}:\n{content}")]
+                if start_line == 1 and max_lines is None:
+                    content = await asyncio.to_thread(file_path.read_text, encoding='utf-8')
+                    return [TextContent(type="text", text=f"Contents of {path}:\n{content}")]
+                
+                content = await asyncio.to_thread(read_lines, file_path, start_line, max_lines)
+                return [TextContent(type="text", text=f"Contents of {path} from line {start_line}:\n{content}")]
             except Exception as e:
                 return [TextContent(type="text", text=f"Error reading file: {str(e)}")]
         
@@ -219,12 +430,13 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> list[TextContent]:
             content = arguments["content"]
             append = arguments.get("append", False)
             
-            file_path = Path(path).expanduser().resolve()
+            # Writes follow the link as it is now, never a cached target
+            file_path = resolve_path_uncached(path, current_dir)
             
             try:
-                mode = 'a' if append else 'w'
-                with open(file_path, mode, encoding='utf-8') as f:
-                    f.write(content)
+                # Write off the event loop so a slow disk doesn't stall other tool calls
+                await asyncio.to_thread(write_text, file_path, content, append)
+                _resolve_cached.cache_clear()
                 
                 action = "Appended to" if append else "Wrote to"
                 return [TextContent(type="text", text=f"{action} file: {path}")]
@@ -243,15 +455,18 @@ async def main():
     logger.info("Starting Command Line MCP Server")
     
     # Run the server using stdio transport
-    async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
-        await server.run(
-            read_stream,
-            write_stream,
-            InitializationOptions(
-                server_name="command-line-server",
-                server_version="1.0.0"
+    try:
+        async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
+            await server.run(
+                read_stream,
+                write_stream,
+                InitializationOptions(
+                    server_name="command-line-server",
+                    server_version="1.0.0"
+                )
             )
-        )
+    finally:
+        await shell_session.close()
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
@@ -13,9 +13,44 @@ from pathlib import Path
 import logging
 import hashlib
 import re
+import orjson
+from collections import Counter
 
 logger = logging.getLogger(__name__)
 
+# Common programming and improvement topics, as (pattern, topic name)
+TOPIC_PATTERNS = [
+    (r'\b(memory|context|management)\b', 'memory|context|management'),
+    (r'\b(improvement|enhance|optimize)\b', 'improvement|enhance|optimize'),
+    (r'\b(conversation|dialogue|chat)\b', 'conversation|dialogue|chat'),
+    (r'\b(code|programming|implementation)\b', 'code|programming|implementation'),
+    (r'\b(git|commit|push|repository)\b', 'git|commit|push|repository'),
+    (r'\b(testing|debug|error|fix)\b', 'testing|debug|error|fix')
+]
+
+# One alternation over every topic pattern so a chunk is scanned once; it is
+# matched against lowercased text, which is cheaper than IGNORECASE
+TOPIC_RE = re.compile(
+    '|'.join(f'(?P<g{i}>{pattern})' for i, (pattern, _) in enumerate(TOPIC_PATTERNS))
+)
+TOPIC_NAMES = {f'g{i}': name for i, (_, name) in enumerate(TOPIC_PATTERNS)}
+
+FILE_RE = re.compile(r'\w+\.(?:py|md|sh)')
+
+# Higher scores for implementation, decisions, errors
+IMPORTANCE_KEYWORDS = {
+    'implement': 2.0,
+    'decision': 1.5, 
+    'error': 1.5,
+    'bug': 1.5,
+    'fix': 1.2,
+    'improve': 1.0,
+    'create': 1.0
+}
+
+# Finds every keyword in a single pass over the text
+IMPORTANCE_RE = re.compile('|'.join(map(re.escape, IMPORTANCE_KEYWORDS)))
+
 @dataclass
 class ConversationChunk:
     """Represents a chunk of conversation for processing"""
@@ -44,9 +79,12 @@ class ConversationSummarizer:
     def __init__(self, chunk_size: int = 10):
         self.chunk_size = chunk_size
         self.current_chunk = []
+        self._chunk_start = None
         
     def add_message(self, message: Dict[str, Any]) -> Optional[ConversationChunk]:
         """Add message to current chunk, return completed chunk if ready"""
+        if not self.current_chunk:
+            self._chunk_start = datetime.now()
         self.current_chunk.append(message)
         
         if len(self.current_chunk) >= self.chunk_size:
@@ -57,83 +95,64 @@ class ConversationSummarizer:
     
     def _create_chunk(self, messages: List[Dict[str, Any]]) -> ConversationChunk:
         """Create a conversation chunk from messages"""
-        chunk_id = hashlib.md5(str(messages[0]).encode()).hexdigest()[:8]
-        start_time = datetime.now()  # TODO: extract from messages
+        chunk_id = hashlib.blake2b(orjson.dumps(messages[0], default=str), digest_size=4).hexdigest()
         end_time = datetime.now()
+        start_time = self._chunk_start or end_time  # TODO: extract from messages
+        
+        # Join and lowercase the chunk's text once and share it between the extractors
+        content = ' '.join([msg.get('content', '') for msg in messages])
+        lower_content = content.lower()
         
         return ConversationChunk(
             id=chunk_id,
             start_time=start_time, 
             end_time=end_time,
             messages=messages,
-            topics=self._extract_topics(messages),
-            summary=self._generate_summary(messages),
-            importance_score=self._calculate_importance(messages),
-            code_changes=self._extract_code_changes(messages)
+            topics=self._extract_topics(lower_content),
+            summary=self._generate_summary(content),
+            importance_score=self._calculate_importance(lower_content),
+            code_changes=self._extract_code_changes(content)
         )
     
-    def _extract_topics(self, messages: List[Dict[str, Any]]) -> List[str]:
-        """Extract key topics from messages"""
+    def _extract_topics(self, lower_content: str) -> List[str]:
+        """Extract key topics from the chunk's lowercased text"""
         # Simple keyword extraction for now - can be enhanced with NLP
-        text = ' '.join([msg.get('content', '') for msg in messages])
-        
-        # Look for common programming and improvement topics
-        topic_patterns = [
-            r'\b(memory|context|management)\b',
-            r'\b(improvement|enhance|optimize)\b', 
-            r'\b(conversation|dialogue|chat)\b',
-            r'\b(code|programming|implementation)\b',
-            r'\b(git|commit|push|repository)\b',
-            r'\b(testing|debug|error|fix)\b'
-        ]
-        
-        topics = []
-        for pattern in topic_patterns:
-            if re.search(pattern, text, re.IGNORECASE):
-                topics.append(pattern.strip('\\b()'))
+        topics = set()
+        for match in TOPIC_RE.finditer(lower_content):
+            topics.add(TOPIC_NAMES[match.lastgroup])
+            if len(topics) == len(TOPIC_PATTERNS):
+                break
                 
-        return list(set(topics))  # Remove duplicates
+        # Report topics in table order rather than set order
+        return [name for _, name in TOPIC_PATTERNS if name in topics]
     
-    def _generate_summary(self, messages: List[Dict[str, Any]]) -> str:
+    def _generate_summary(self, content: str) -> str:
         """Generate summary of conversation chunk"""
         # Basic summary - extract key sentences
-        content = ' '.join([msg.get('content', '') for msg in messages])
-        sentences = content.split('.')
-        
-        # Take first and last sentences as basic summary
-        if len(sentences) > 2:
-            return f"{sentences[0].strip()}. ... {sentences[-2].strip()}."
+        # Take first and last sentences as basic summary, locating them by
+        # their periods rather than splitting the whole chunk into sentences
+        first = content.find('.')
+        last = content.rfind('.')
+        if first != last:
+            previous = content.rfind('.', 0, last)
+            return f"{content[:first].strip()}. ... {content[previous + 1:last].strip()}."
         return content[:200] + '...' if len(content) > 200 else content
     
-    def _calculate_importance(self, messages: List[Dict[str, Any]]) -> float:
-        """Calculate importance score for chunk"""
-        content = ' '.join([msg.get('content', '') for msg in messages])
-        
-        # Higher scores for implementation, decisions, errors
-        importance_keywords = {
-            'implement': 2.0,
-            'decision': 1.5, 
-            'error': 1.5,
-            'bug': 1.5,
-            'fix': 1.2,
-            'improve': 1.0,
-            'create': 1.0
-        }
+    def _calculate_importance(self, lower_content: str) -> float:
+        """Calculate importance score from the chunk's lowercased text"""
+        counts = Counter(IMPORTANCE_RE.findall(lower_content))
         
         score = 0.0
-        for keyword, weight in importance_keywords.items():
-            score += content.lower().count(keyword) * weight
+        for keyword, weight in IMPORTANCE_KEYWORDS.items():
+            score += counts[keyword] * weight
             
         return min(score, 10.0)  # Cap at 10
     
-    def _extract_code_changes(self, messages: List[Dict[str, Any]]) -> List[str]:
+    def _extract_code_changes(self, content: str) -> List[str]:
         """Extract mentions of code changes"""
-        changes = []
-        for msg in messages:
-            content = msg.get('content', '')
-            # Look for file mentions, function names, etc.
-            file_matches = re.findall(r'(\w+\.py|\w+\.md|\w+\.sh)', content)
-            changes.extend(file_matches)
-        return list(set(changes))
+        # Look for file mentions, function names, etc.
+        # Dedup in first-mention order without building the full match list
+        changes = dict.fromkeys(match.group() for match in FILE_RE.finditer(content))
+        return list(changes)
 
 